@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.datastructures import QueryParams
 import httpx
 import uvicorn
 import json
@@ -9,13 +10,18 @@ from fastapi_cache.backends.redis import RedisBackend
 from fastapi_cache.decorator import cache
 import redis
 import os
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 import random
-from typing import List
+import asyncio
+import base64
+import hashlib
+from urllib.parse import urlencode
+from typing import AsyncIterator, List
 import time
 # Import Prometheus client
 from prometheus_client import Counter, Histogram, Gauge, Summary, generate_latest, CONTENT_TYPE_LATEST
 from functools import wraps
+import collections
 
 app = FastAPI(title="Paranormal Activity Hunting Gateway")
 
@@ -23,6 +29,11 @@ app = FastAPI(title="Paranormal Activity Hunting Gateway")
 USER_SERVICE_URLS = os.getenv("USER_SERVICE_URLS", "http://user-management-api-1:8080,http://user-management-api-2:8080,http://user-management-api-3:8080").split(",")
 SESSION_SERVICE_URLS = os.getenv("SESSION_SERVICE_URLS", "http://session-management-api-1:8080,http://session-management-api-2:8080,http://session-management-api-3:8080").split(",")
 
+# Session listing pagination
+SESSION_PAGE_DEFAULT_LIMIT = int(os.getenv("SESSION_PAGE_DEFAULT_LIMIT", 20))
+SESSION_PAGE_MAX_LIMIT = int(os.getenv("SESSION_PAGE_MAX_LIMIT", 100))
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
 # Counters for Round Robin load balancing
 user_service_counter = 0
 session_service_counter = 0
@@ -32,6 +43,32 @@ REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "")
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
+CACHE_KEY_MAX_LENGTH = int(os.getenv("CACHE_KEY_MAX_LENGTH", 200))
+
+# Cache analytics and adaptive TTLs
+CACHE_META_TTL = int(os.getenv("CACHE_META_TTL", 86400))
+CACHE_TOP_KEYS_TRACKED = int(os.getenv("CACHE_TOP_KEYS_TRACKED", 100))
+CACHE_ADAPTIVE_TTL = os.getenv("CACHE_ADAPTIVE_TTL", "false").lower() == "true"
+CACHE_ADAPTIVE_TTL_MIN = int(os.getenv("CACHE_ADAPTIVE_TTL_MIN", 30))
+CACHE_ADAPTIVE_TTL_MAX = int(os.getenv("CACHE_ADAPTIVE_TTL_MAX", 3600 * 24))
+# Default per-route bounds: the configured TTL divided / multiplied by this factor
+CACHE_ADAPTIVE_TTL_RANGE = float(os.getenv("CACHE_ADAPTIVE_TTL_RANGE", 4))
+CACHE_ADAPTIVE_TTL_INCREASE = float(os.getenv("CACHE_ADAPTIVE_TTL_INCREASE", 1.25))
+CACHE_ADAPTIVE_TTL_DECREASE = float(os.getenv("CACHE_ADAPTIVE_TTL_DECREASE", 0.5))
+
+CACHE_FOOTPRINT_INTERVAL = int(os.getenv("CACHE_FOOTPRINT_INTERVAL", 60))
+
+# Per-route cache statistics, keyed by route function name
+CACHE_ROUTE_STATS = {}
+
+# Per-route cache entries and bytes from the last keyspace scan
+CACHE_FOOTPRINT = {}
+
+# Idempotency-Key handling for mutating routes
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", 86400))
+IDEMPOTENCY_LOCK_TTL = int(os.getenv("IDEMPOTENCY_LOCK_TTL", 30))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", 10))
+IDEMPOTENCY_POLL_INTERVAL = 0.1
 
 # Configure CORS
 app.add_middleware(
@@ -82,6 +119,47 @@ CACHE_MISSES = Counter(
     ['endpoint']
 )
 
+CACHE_REFRESHES = Counter(
+    'api_gateway_cache_refreshes_total',
+    'Total count of cache entries refreshed after expiry',
+    ['endpoint']
+)
+
+CACHE_CHANGES = Counter(
+    'api_gateway_cache_changes_total',
+    'Total count of refreshed cache entries whose body changed',
+    ['endpoint']
+)
+
+CACHE_HIT_RATIO = Gauge(
+    'api_gateway_cache_hit_ratio',
+    'Cache hit ratio per endpoint',
+    ['endpoint']
+)
+
+CACHE_CHANGE_RATE = Gauge(
+    'api_gateway_cache_change_rate',
+    'Share of cache refreshes where the upstream body changed',
+    ['endpoint']
+)
+
+CACHE_BYTES = Gauge(
+    'api_gateway_cache_bytes',
+    'Bytes held in the cache per endpoint, refreshed every CACHE_FOOTPRINT_INTERVAL seconds',
+    ['endpoint']
+)
+
+CACHE_TTL_SECONDS = Gauge(
+    'api_gateway_cache_ttl_seconds',
+    'Current cache TTL per endpoint',
+    ['endpoint']
+)
+
+IDEMPOTENT_REPLAYS = Counter(
+    'api_gateway_idempotent_replays_total',
+    'Total count of responses replayed for a repeated Idempotency-Key'
+)
+
 SERVICE_AVAILABILITY = Gauge(
     'api_gateway_service_availability',
     'Service availability status (1=up, 0=down)',
@@ -101,6 +179,13 @@ def get_next_session_service_url() -> str:
     session_service_counter += 1
     return url
 
+def forwarded_query_params(request: Request) -> QueryParams:
+    """
+    Query parameters to send upstream: the canonical set chosen by tracked_cache when the
+    route is cached, so the cache key and the upstream request cannot disagree
+    """
+    return getattr(request.state, "forwarded_query_params", request.query_params)
+
 async def forward_request(request: Request, service_type: str, path: str) -> JSONResponse:
     try:
         # Get the next service URL using Round Robin
@@ -139,7 +224,7 @@ async def forward_request(request: Request, service_type: str, path: str) -> JSO
                     url=target_url,
                     headers=headers,
                     content=body,
-                    params=request.query_params,
+                    params=forwarded_query_params(request),
                 )
                 
                 # Try to parse JSON response
@@ -172,11 +257,13 @@ async def forward_request(request: Request, service_type: str, path: str) -> JSO
             raise e
             
     except httpx.RequestError as e:
-        # If a service instance is down, try the next one
-        if service_type == "user" and len(USER_SERVICE_URLS) > 1:
+        # If a service instance is down, try the next one. Writes are only retried when
+        # the connection was never established, since the backend may have applied them
+        retryable = request.method in ["GET", "HEAD", "OPTIONS"] or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+        if retryable and service_type == "user" and len(USER_SERVICE_URLS) > 1:
             # Try another user service instance
             return await forward_request(request, service_type, path)
-        elif service_type == "session" and len(SESSION_SERVICE_URLS) > 1:
+        elif retryable and service_type == "session" and len(SESSION_SERVICE_URLS) > 1:
             # Try another session service instance
             return await forward_request(request, service_type, path)
         else:
@@ -212,22 +299,327 @@ async def forward_request(request: Request, service_type: str, path: str) -> JSO
             status_code=500
         )
 
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+def parse_sort_value(value):
+    # Listings are sorted by .NET DateTime values; timestamps without an offset are UTC
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def encode_cursor(session: dict, sort_field) -> str:
+    """
+    Keyset cursor pointing after the given session: its id plus the value it is sorted by
+    """
+    position = {"id": session.get("id")}
+    if sort_field:
+        position["sort"] = session.get(sort_field)
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    position = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    if not isinstance(position, dict) or "id" not in position:
+        raise ValueError("Malformed cursor")
+    position["sort"] = parse_sort_value(position.get("sort"))
+    return position
+
+async def iter_json_array_items(chunks: AsyncIterator[bytes]) -> AsyncIterator:
+    """
+    Incrementally yield the elements of the first top-level array in a JSON document,
+    e.g. the "sessions" list of {"sessions": [...]}, without buffering the whole body
+    """
+    depth = 0
+    in_string = False
+    escaped = False
+    in_array = False
+    item = bytearray()
+
+    async for chunk in chunks:
+        for byte in chunk:
+            if in_string:
+                if in_array:
+                    item.append(byte)
+                if escaped:
+                    escaped = False
+                elif byte == 0x5C:  # backslash
+                    escaped = True
+                elif byte == 0x22:  # closing quote
+                    in_string = False
+                continue
+
+            if byte == 0x22:  # opening quote
+                in_string = True
+                if in_array:
+                    item.append(byte)
+            elif not in_array:
+                if byte == 0x5B and depth <= 1:  # the array we are looking for
+                    in_array = True
+                    depth = 2
+                elif byte in (0x7B, 0x5B):
+                    depth += 1
+                elif byte in (0x7D, 0x5D):
+                    depth -= 1
+            elif byte == 0x2C and depth == 2:  # separator between array elements
+                if item.strip():
+                    yield json.loads(bytes(item))
+                item.clear()
+            elif byte == 0x5D and depth == 2:  # end of the array
+                if item.strip():
+                    yield json.loads(bytes(item))
+                return
+            else:
+                if byte in (0x7B, 0x5B):
+                    depth += 1
+                elif byte in (0x7D, 0x5D):
+                    depth -= 1
+                item.append(byte)
+
+def normalize_page_params(query_params: QueryParams) -> QueryParams:
+    """
+    Canonical form of the gateway's paging parameters so each distinct page has one cache
+    entry: a single cursor and an explicit limit clamped to SESSION_PAGE_MAX_LIMIT.
+    Invalid limits are left as-is for list_sessions to reject
+    """
+    if "limit" not in query_params and "cursor" not in query_params:
+        return query_params
+
+    # Duplicates collapse to the last value, which is what QueryParams.get reads
+    items = [(key, value) for key, value in query_params.multi_items() if key not in ["limit", "cursor"]]
+    limit = query_params.get("limit", str(SESSION_PAGE_DEFAULT_LIMIT))
+    try:
+        if int(limit) >= 1:
+            limit = str(min(int(limit), SESSION_PAGE_MAX_LIMIT))
+    except ValueError:
+        pass
+    items.append(("limit", limit))
+    if "cursor" in query_params:
+        items.append(("cursor", query_params["cursor"]))
+    return QueryParams(sorted(items, key=lambda item: item[0]))
+
+async def sessions_after_cursor(sessions: AsyncIterator, position, sort_field) -> AsyncIterator:
+    """
+    Yield the sessions that follow the cursor in a listing sorted descending by sort_field.
+    The cursor session is matched by id while its sort value is unchanged; if it was
+    removed or re-sorted, the listing resumes at the first session sorting after it
+    """
+    started = position is None
+    async for session in sessions:
+        if started:
+            yield session
+            continue
+
+        try:
+            sort_value = parse_sort_value(session.get(sort_field)) if sort_field else None
+        except (TypeError, ValueError):
+            sort_value = None
+        if session.get("id") == position["id"] and sort_value == position["sort"]:
+            started = True
+        elif sort_value is not None and position["sort"] is not None and sort_value < position["sort"]:
+            started = True
+            yield session
+
+async def list_sessions(request: Request, path: str, sort_field=None) -> Response:
+    """
+    Forward a session listing request, serving a cursor-paginated page when
+    limit/cursor are given and an NDJSON stream when the client accepts it.
+    Both modes page the same way; a paginated stream ends with a
+    {"next_cursor": ...} line, an unpaginated one streams every session.
+    sort_field names the field the upstream listing is sorted by, descending,
+    and is used with the session id to build keyset cursors
+    """
+    streaming = wants_ndjson(request)
+    query_params = forwarded_query_params(request)
+    paginated = "limit" in query_params or "cursor" in query_params
+    if not streaming and not paginated:
+        return await forward_request(request, "session", path)
+
+    try:
+        limit = int(query_params.get("limit", SESSION_PAGE_DEFAULT_LIMIT))
+        position = decode_cursor(query_params["cursor"]) if "cursor" in query_params else None
+    except (TypeError, ValueError):
+        return JSONResponse(
+            content={"error": "Invalid limit or cursor"},
+            status_code=400
+        )
+    if limit < 1:
+        return JSONResponse(
+            content={"error": "limit must be a positive integer"},
+            status_code=400
+        )
+    limit = min(limit, SESSION_PAGE_MAX_LIMIT)
+
+    headers = {
+        key: value for key, value in request.headers.items()
+        if key.lower() not in ["host", "content-length", "accept"]
+    }
+    params = [
+        (key, value) for key, value in query_params.multi_items()
+        if key not in ["limit", "cursor"]
+    ]
+
+    REQUESTS.labels(method=request.method, endpoint=path, service="session").inc()
+    ACTIVE_REQUESTS.labels(method=request.method, service="session").inc()
+    start_time = time.time()
+
+    # If a service instance is down, try the next one, giving each instance one attempt
+    client = httpx.AsyncClient()
+    upstream = None
+    for _ in range(len(SESSION_SERVICE_URLS)):
+        service_url = get_next_session_service_url()
+        try:
+            upstream = await client.send(
+                client.build_request("GET", f"{service_url}/{path}", headers=headers, params=params),
+                stream=True
+            )
+            break
+        except httpx.RequestError as e:
+            error = e
+
+    if upstream is None:
+        await client.aclose()
+        ACTIVE_REQUESTS.labels(method=request.method, service="session").dec()
+        RESPONSES.labels(method=request.method, endpoint=path, status=503, service="session").inc()
+        return JSONResponse(
+            content={"error": f"Service unavailable: {str(error)}"},
+            status_code=503
+        )
+
+    async def finish():
+        await upstream.aclose()
+        await client.aclose()
+        LATENCY.labels(method=request.method, endpoint=path, service="session").observe(time.time() - start_time)
+        RESPONSES.labels(method=request.method, endpoint=path, status=upstream.status_code, service="session").inc()
+        ACTIVE_REQUESTS.labels(method=request.method, service="session").dec()
+
+    if upstream.status_code != 200:
+        try:
+            await upstream.aread()
+            try:
+                response_data = upstream.json() if upstream.content else None
+            except json.JSONDecodeError:
+                response_data = {"message": upstream.text}
+        finally:
+            await finish()
+        return JSONResponse(content=response_data, status_code=upstream.status_code)
+
+    if streaming:
+        async def stream_sessions():
+            try:
+                sent = 0
+                last_session = None
+                next_cursor = None
+                sessions = sessions_after_cursor(iter_json_array_items(upstream.aiter_bytes()), position, sort_field)
+                async for session in sessions:
+                    if paginated and sent == limit:
+                        next_cursor = encode_cursor(last_session, sort_field)
+                        break
+                    yield json.dumps(session) + "\n"
+                    sent += 1
+                    last_session = session
+                if paginated:
+                    yield json.dumps({"next_cursor": next_cursor}) + "\n"
+            finally:
+                await finish()
+
+        return StreamingResponse(stream_sessions(), media_type=NDJSON_MEDIA_TYPE)
+
+    # Read one session past the page to know whether another page exists, then stop
+    # consuming the upstream body so gateway memory stays bounded by the page size
+    sessions = []
+    has_more = False
+    try:
+        async for session in sessions_after_cursor(iter_json_array_items(upstream.aiter_bytes()), position, sort_field):
+            if len(sessions) == limit:
+                has_more = True
+                break
+            sessions.append(session)
+    finally:
+        await finish()
+
+    return JSONResponse(content={
+        "sessions": sessions,
+        "limit": limit,
+        "next_cursor": encode_cursor(sessions[-1], sort_field) if has_more else None
+    })
+
 from functools import wraps
 
-def tracked_cache(expire=300):
+def canonical_query_params(request: Request, params=None, defaults=None) -> QueryParams:
+    """
+    Keep only allow-listed query parameters, matched case-insensitively like the upstream
+    [FromQuery] binding and renamed to their declared spelling, sorted by name with defaults dropped
+    """
+    defaults = defaults or {}
+    allowed = {name.lower(): name for name in params} if params is not None else None
+    items = []
+    for key, value in request.query_params.multi_items():
+        if allowed is not None:
+            if key.lower() not in allowed:
+                continue
+            key = allowed[key.lower()]
+        if defaults.get(key) != value:
+            items.append((key, value))
+    # Sort by name only; repeated parameters keep the client's order
+    return QueryParams(sorted(items, key=lambda item: item[0]))
+
+def build_cache_key(request: Request, name: str, query_params: QueryParams, public: bool = False, vary_headers=()) -> str:
+    """
+    Build a canonical cache key from the path parameters and canonical query parameters;
+    per-principal routes include a hash of the Authorization header, and keys longer
+    than CACHE_KEY_MAX_LENGTH are hashed
+    """
+    path_part = "&".join(f"{key}={value}" for key, value in sorted(request.path_params.items()))
+    query_part = urlencode(query_params.multi_items())
+
+    vary = []
+    if not public:
+        vary.append(("authorization", request.headers.get("authorization", "")))
+    vary.extend((header.lower(), request.headers.get(header, "")) for header in vary_headers)
+    vary_part = hashlib.sha256(urlencode(vary).encode()).hexdigest()[:16] if vary else "public"
+
+    cache_key = f"{name}:{path_part}:{query_part}:{vary_part}"
+    if len(cache_key) > CACHE_KEY_MAX_LENGTH:
+        # Keep short path parameters readable so pattern-based invalidation still matches
+        prefix = f"{name}:{path_part}" if len(path_part) <= 64 else name
+        cache_key = f"{prefix}:sha256:{hashlib.sha256(cache_key.encode()).hexdigest()}"
+    return cache_key
+
+def tracked_cache(expire=300, public=False, params=None, defaults=None, vary_headers=(), normalize=None, min_ttl=None, max_ttl=None):
+    """
+    Cache a GET route in Redis. Routes are per-principal unless declared public;
+    params restricts which query parameters take part in the key and are forwarded
+    upstream (None keeps all), and normalize can rewrite them into a canonical form.
+    min_ttl/max_ttl bound the adaptive TTL of the route
+    and default to expire divided / multiplied by CACHE_ADAPTIVE_TTL_RANGE
+    """
     def decorator(func):
+        route = func.__name__
+        CACHE_ROUTE_STATS[route] = new_cache_route_stats(expire, public, min_ttl, max_ttl)
+        CACHE_TTL_SECONDS.labels(endpoint=route).set(expire)
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            # Extract request object
-            request = next((arg for arg in args if isinstance(arg, Request)), None)
+            # Extract request object, FastAPI passes endpoint arguments by keyword
+            request = next((arg for arg in [*args, *kwargs.values()] if isinstance(arg, Request)), None)
             if request is None:
                 # If no request object, just call the original function
                 return await func(*args, **kwargs)
 
-            # Construct cache key using path and query parameters
-            path_params = request.path_params
-            query_params = request.query_params
-            cache_key = f"{func.__name__}:{str(path_params)}:{str(query_params)}"
+            # Forward exactly the parameters the cache key is built from
+            query_params = canonical_query_params(request, params, defaults)
+            if normalize is not None:
+                query_params = normalize(query_params)
+            request.state.forwarded_query_params = query_params
+
+            # Streamed responses are never buffered into the cache
+            if wants_ndjson(request):
+                return await func(*args, **kwargs)
+
+            cache_key = build_cache_key(request, route, query_params, public, vary_headers)
+            stats = CACHE_ROUTE_STATS[route]
 
             # Check if result is in cache
             redis_client = redis.Redis(
@@ -239,20 +631,25 @@ def tracked_cache(expire=300):
             
             cached_result = redis_client.get(f"fastapi-cache:{cache_key}")
             if cached_result:
-                CACHE_HITS.labels(endpoint=func.__name__).inc()
+                CACHE_HITS.labels(endpoint=route).inc()
+                record_cache_hit(route, cache_key)
                 redis_client.close()
-                return JSONResponse(content=json.loads(cached_result))
+                return Response(content=cached_result, media_type="application/json")
             
             # If not in cache, call the original function
-            CACHE_MISSES.labels(endpoint=func.__name__).inc()
+            CACHE_MISSES.labels(endpoint=route).inc()
+            stats["misses"] += 1
+            update_cache_ratio_metrics(route)
             result = await func(*args, **kwargs)
 
-            # Cache the result
-            redis_client.setex(
-                f"fastapi-cache:{cache_key}",
-                expire,
-                json.dumps(result.body.decode())
-            )
+            # Only successful responses are cached, errors are retried on the next request
+            if result.status_code == 200:
+                record_cache_refresh(redis_client, route, cache_key, result.body)
+                redis_client.setex(
+                    f"fastapi-cache:{cache_key}",
+                    int(stats["ttl"]),
+                    result.body
+                )
             redis_client.close()
 
             return result
@@ -260,6 +657,205 @@ def tracked_cache(expire=300):
         return wrapper
     return decorator
 
+def new_cache_route_stats(expire: int, public: bool, min_ttl=None, max_ttl=None) -> dict:
+    # Route bounds never extend past the global adaptive TTL limits
+    if min_ttl is None:
+        min_ttl = expire / CACHE_ADAPTIVE_TTL_RANGE
+    if max_ttl is None:
+        max_ttl = expire * CACHE_ADAPTIVE_TTL_RANGE
+    min_ttl = min(max(min_ttl, CACHE_ADAPTIVE_TTL_MIN), expire)
+    max_ttl = max(min(max_ttl, CACHE_ADAPTIVE_TTL_MAX), expire)
+    return {
+        "hits": 0,
+        "misses": 0,
+        "refreshes": 0,
+        "changes": 0,
+        "configured_ttl": expire,
+        "min_ttl": int(min_ttl),
+        "max_ttl": int(max_ttl),
+        "ttl": expire,
+        "public": public,
+        "key_hits": collections.Counter(),
+    }
+
+def update_cache_ratio_metrics(route: str):
+    stats = CACHE_ROUTE_STATS[route]
+    lookups = stats["hits"] + stats["misses"]
+    CACHE_HIT_RATIO.labels(endpoint=route).set(stats["hits"] / lookups if lookups else 0)
+
+def record_cache_hit(route: str, cache_key: str):
+    stats = CACHE_ROUTE_STATS[route]
+    stats["hits"] += 1
+    # Per-principal keys carry user ids, so top keys are only tracked for public routes
+    if stats["public"]:
+        key_hits = stats["key_hits"]
+        key_hits[cache_key] += 1
+        # Keep per-key hit tracking bounded, dropping the coldest keys
+        if len(key_hits) > CACHE_TOP_KEYS_TRACKED * 2:
+            stats["key_hits"] = collections.Counter(dict(key_hits.most_common(CACHE_TOP_KEYS_TRACKED)))
+    update_cache_ratio_metrics(route)
+
+def record_cache_refresh(redis_client, route: str, cache_key: str, body: bytes):
+    """
+    Compare the refreshed body hash with the previous one for this key to measure how
+    often the upstream value changes, and adapt the route TTL when enabled
+    """
+    stats = CACHE_ROUTE_STATS[route]
+    body_hash = hashlib.sha256(body).hexdigest()
+    meta_key = f"cache-meta:{cache_key}"
+    previous_hash = redis_client.get(meta_key)
+    redis_client.setex(meta_key, CACHE_META_TTL, body_hash)
+    if previous_hash is None:
+        return
+
+    changed = previous_hash.decode() != body_hash
+    stats["refreshes"] += 1
+    CACHE_REFRESHES.labels(endpoint=route).inc()
+    if changed:
+        stats["changes"] += 1
+        CACHE_CHANGES.labels(endpoint=route).inc()
+    CACHE_CHANGE_RATE.labels(endpoint=route).set(stats["changes"] / stats["refreshes"])
+
+    if CACHE_ADAPTIVE_TTL:
+        # Back off quickly on volatile content and grow slowly on stable content
+        factor = CACHE_ADAPTIVE_TTL_DECREASE if changed else CACHE_ADAPTIVE_TTL_INCREASE
+        stats["ttl"] = min(max(stats["ttl"] * factor, stats["min_ttl"]), stats["max_ttl"])
+        CACHE_TTL_SECONDS.labels(endpoint=route).set(int(stats["ttl"]))
+
+def collect_cache_footprint() -> dict:
+    """
+    Scan the cache namespace in Redis and return the number of entries and bytes used per route.
+    This walks the whole keyspace, so it only runs from refresh_cache_footprint
+    """
+    footprint = {}
+    redis_client = redis.Redis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        password=REDIS_PASSWORD,
+        db=REDIS_DB
+    )
+    keys = list(redis_client.scan_iter(match="fastapi-cache:*", count=500))
+    pipeline = redis_client.pipeline()
+    for key in keys:
+        pipeline.strlen(key)
+    sizes = pipeline.execute()
+    redis_client.close()
+
+    for key, size in zip(keys, sizes):
+        route = key.decode().split(":")[1]
+        entry = footprint.setdefault(route, {"entries": 0, "bytes": 0})
+        entry["entries"] += 1
+        entry["bytes"] += size + len(key)
+
+    for route in CACHE_ROUTE_STATS:
+        CACHE_BYTES.labels(endpoint=route).set(footprint.get(route, {}).get("bytes", 0))
+    return footprint
+
+async def refresh_cache_footprint():
+    """
+    Refresh the cache footprint every CACHE_FOOTPRINT_INTERVAL seconds, scanning Redis
+    off the event loop so gateway traffic is not stalled
+    """
+    global CACHE_FOOTPRINT
+    while True:
+        try:
+            CACHE_FOOTPRINT = await asyncio.to_thread(collect_cache_footprint)
+        except redis.RedisError:
+            pass
+        await asyncio.sleep(CACHE_FOOTPRINT_INTERVAL)
+
+def idempotent(ttl=IDEMPOTENCY_TTL):
+    """
+    Honour the Idempotency-Key header on a mutating route: the first request stores
+    an in-progress marker and then its final response in Redis, concurrent duplicates
+    wait for it to finish and completed duplicates replay the stored response
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            request = next((arg for arg in args if isinstance(arg, Request)), None)
+            if request is None:
+                request = next((arg for arg in kwargs.values() if isinstance(arg, Request)), None)
+            idempotency_key = request.headers.get("idempotency-key") if request is not None else None
+            if not idempotency_key:
+                return await func(*args, **kwargs)
+
+            # Scope keys to the caller so two users cannot collide on the same key
+            principal = request.headers.get("authorization", "")
+            scope = hashlib.sha256(f"{principal}:{idempotency_key}".encode()).hexdigest()
+            redis_key = f"idempotency:{func.__name__}:{scope}"
+            body = await request.body()
+            fingerprint = hashlib.sha256(request.method.encode() + request.url.path.encode() + body).hexdigest()
+
+            redis_client = redis.Redis(
+                host=REDIS_HOST,
+                port=REDIS_PORT,
+                password=REDIS_PASSWORD,
+                db=REDIS_DB
+            )
+            try:
+                in_progress = json.dumps({"state": "in_progress", "fingerprint": fingerprint})
+                if not redis_client.set(redis_key, in_progress, nx=True, ex=IDEMPOTENCY_LOCK_TTL):
+                    return await replay_idempotent_response(redis_client, redis_key, fingerprint)
+
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception:
+                    redis_client.delete(redis_key)
+                    raise
+
+                # Server errors are not stored so the client can retry them
+                if result.status_code >= 500:
+                    redis_client.delete(redis_key)
+                else:
+                    redis_client.setex(redis_key, ttl, json.dumps({
+                        "state": "completed",
+                        "fingerprint": fingerprint,
+                        "status_code": result.status_code,
+                        "body": result.body.decode()
+                    }))
+                return result
+            finally:
+                redis_client.close()
+
+        return wrapper
+    return decorator
+
+async def replay_idempotent_response(redis_client, redis_key: str, fingerprint: str) -> Response:
+    """
+    Wait for the original request holding an idempotency key to finish and replay its response
+    """
+    deadline = time.time() + IDEMPOTENCY_WAIT_TIMEOUT
+    while True:
+        stored = redis_client.get(redis_key)
+        if stored is None:
+            # The original request failed and released the key
+            return JSONResponse(
+                content={"error": "Original request with this Idempotency-Key failed, retry the request"},
+                status_code=409
+            )
+
+        record = json.loads(stored)
+        if record["fingerprint"] != fingerprint:
+            return JSONResponse(
+                content={"error": "Idempotency-Key was already used with a different request"},
+                status_code=422
+            )
+        if record["state"] == "completed":
+            IDEMPOTENT_REPLAYS.inc()
+            return Response(
+                content=record["body"],
+                status_code=record["status_code"],
+                media_type="application/json",
+                headers={"Idempotent-Replayed": "true"}
+            )
+        if time.time() >= deadline:
+            return JSONResponse(
+                content={"error": "A request with this Idempotency-Key is still in progress"},
+                status_code=409
+            )
+        await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
 # Initialize Redis cache on startup
 @app.on_event("startup")
 async def startup():
@@ -278,6 +874,9 @@ async def startup():
     for i, url in enumerate(SESSION_SERVICE_URLS):
         SERVICE_AVAILABILITY.labels(service_name="session-management", instance=f"session-management-api-{i+1}").set(1)
 
+    # Keep the cache footprint metrics fresh in the background
+    app.state.cache_footprint_task = asyncio.create_task(refresh_cache_footprint())
+
 # Expose Prometheus metrics endpoint
 @app.get("/metrics")
 async def metrics():
@@ -358,55 +957,14 @@ async def user_login_email(request: Request):
 async def user_login_secure_questions(request: Request):
     return await forward_request(request, "user", "user/login/secure-questions")
 
-# User Profile Related Endpoints - ADDING CACHE HERE
-@app.get("/user/{id}")
-@tracked_cache(expire=300)  # Cache for 5 minutes
-async def get_user(request: Request, id: str):
-    return await forward_request(request, "user", f"user/{id}")
-
-@app.get("/user/{id}/profile")
-@tracked_cache(expire=300)  # Cache for 5 minutes
-async def get_user_profile(request: Request, id: str):
-    return await forward_request(request, "user", f"user/{id}/profile")
-
-@app.get("/user/{id}/xp")
-@tracked_cache(expire=60)  # Cache for 1 minute
-async def get_user_xp(request: Request, id: str):
-    return await forward_request(request, "user", f"user/{id}/xp")
-
-@app.get("/user/{id}/challenges-completed")
-@tracked_cache(expire=300)  # Cache for 5 minutes
-async def get_user_challenges_completed(request: Request, id: str):
-    return await forward_request(request, "user", f"user/{id}/challenges-completed")
-
-@app.get("/user/{id}/inventory")
-@tracked_cache(expire=300)  # Cache for 5 minutes
-async def get_user_inventory(request: Request, id: str):
-    return await forward_request(request, "user", f"user/{id}/inventory")
-
-@app.get("/user/{id}/created")
-@tracked_cache(expire=3600)  # Cache for 1 hour
-async def get_user_created(request: Request, id: str):
-    return await forward_request(request, "user", f"user/{id}/created")
-
-@app.get("/user/{id}/updated")
-@tracked_cache(expire=300)  # Cache for 5 minutes
-async def get_user_updated(request: Request, id: str):
-    return await forward_request(request, "user", f"user/{id}/updated")
-
-@app.get("/user/{id}/admin-status")
-@tracked_cache(expire=600)  # Cache for 10 minutes
-async def get_user_admin_status(request: Request, id: str):
-    return await forward_request(request, "user", f"user/{id}/admin-status")
-
-@app.put("/user/{id}/update")
-async def update_user_profile(request: Request, id: str):
-    # No cache for update operations
-    return await forward_request(request, "user", f"user/{id}/update")
+#Health Check
+@app.get("/user/status")
+async def user_status(request: Request):
+    return await forward_request(request, "user", "user/status")
 
 # Challenge Related Endpoints
 @app.get("/user/challenges")
-@tracked_cache(expire=600)  # Cache for 10 minutes
+@tracked_cache(expire=600, public=True, params=())  # Cache for 10 minutes
 async def get_challenges(request: Request):
     return await forward_request(request, "user", "user/challenges")
 
@@ -423,107 +981,211 @@ async def assign_challenge(request: Request):
     return await forward_request(request, "user", "user/challenges/assign")
 
 @app.post("/user/challenges/complete")
+@idempotent()
 async def complete_challenge(request: Request):
     return await forward_request(request, "user", "user/challenges/complete")
 
 @app.get("/user/challenges/completed")
-@tracked_cache(expire=300)  # Cache for 5 minutes
+@tracked_cache(expire=300, params=("userId",))  # Cache for 5 minutes
 async def get_completed_challenges(request: Request):
     return await forward_request(request, "user", "user/challenges/completed")
 
 @app.get("/user/challenges/daily")
-@tracked_cache(expire=3600)  # Cache for 1 hour
+@tracked_cache(expire=3600, public=True, params=())  # Cache for 1 hour
 async def get_daily_challenges(request: Request):
     return await forward_request(request, "user", "user/challenges/daily")
 
 @app.get("/user/challenges/weekly")
-@tracked_cache(expire=3600 * 6)  # Cache for 6 hours
+@tracked_cache(expire=3600 * 6, public=True, params=())  # Cache for 6 hours
 async def get_weekly_challenges(request: Request):
     return await forward_request(request, "user", "user/challenges/weekly")
 
 @app.get("/user/challenges/rewards")
-@tracked_cache(expire=3600)  # Cache for 1 hour
+@tracked_cache(expire=3600, public=True, params=("challengeId",))  # Cache for 1 hour
 async def get_challenge_rewards(request: Request):
     return await forward_request(request, "user", "user/challenges/rewards")
 
-#Health Check
-@app.get("/user/status")
-async def user_status(request: Request):
-    return await forward_request(request, "user", "user/status")
+# User Profile Related Endpoints - ADDING CACHE HERE
+# Registered after /user/status and /user/challenges so they are not captured as a user id
+@app.get("/user/{id}")
+@tracked_cache(expire=300, params=())  # Cache for 5 minutes
+async def get_user(request: Request, id: str):
+    return await forward_request(request, "user", f"user/{id}")
+
+@app.get("/user/{id}/profile")
+@tracked_cache(expire=300, params=())  # Cache for 5 minutes
+async def get_user_profile(request: Request, id: str):
+    return await forward_request(request, "user", f"user/{id}/profile")
+
+@app.get("/user/{id}/xp")
+@tracked_cache(expire=60, params=())  # Cache for 1 minute
+async def get_user_xp(request: Request, id: str):
+    return await forward_request(request, "user", f"user/{id}/xp")
+
+@app.get("/user/{id}/challenges-completed")
+@tracked_cache(expire=300, params=())  # Cache for 5 minutes
+async def get_user_challenges_completed(request: Request, id: str):
+    return await forward_request(request, "user", f"user/{id}/challenges-completed")
+
+@app.get("/user/{id}/inventory")
+@tracked_cache(expire=300, params=())  # Cache for 5 minutes
+async def get_user_inventory(request: Request, id: str):
+    return await forward_request(request, "user", f"user/{id}/inventory")
+
+@app.get("/user/{id}/created")
+@tracked_cache(expire=3600, params=())  # Cache for 1 hour
+async def get_user_created(request: Request, id: str):
+    return await forward_request(request, "user", f"user/{id}/created")
+
+@app.get("/user/{id}/updated")
+@tracked_cache(expire=300, params=())  # Cache for 5 minutes
+async def get_user_updated(request: Request, id: str):
+    return await forward_request(request, "user", f"user/{id}/updated")
+
+@app.get("/user/{id}/admin-status")
+@tracked_cache(expire=600, params=())  # Cache for 10 minutes
+async def get_user_admin_status(request: Request, id: str):
+    return await forward_request(request, "user", f"user/{id}/admin-status")
+
+@app.put("/user/{id}/update")
+async def update_user_profile(request: Request, id: str):
+    # No cache for update operations
+    return await forward_request(request, "user", f"user/{id}/update")
 
 # Session Service Routes
 # Session Creation Endpoints
 @app.post("/session/create/quick")
+@idempotent()
 async def create_quick_session(request: Request):
     return await forward_request(request, "session", "session/create/quick")
 
 @app.post("/session/create/private")
+@idempotent()
 async def create_private_session(request: Request):
     return await forward_request(request, "session", "session/create/private")
 
 @app.post("/session/create/test")
+@idempotent()
 async def create_test_session(request: Request):
     return await forward_request(request, "session", "session/create/test")
 
 @app.post("/session/create/group")
+@idempotent()
 async def create_group_session(request: Request):
     return await forward_request(request, "session", "session/create/group")
 
 @app.post("/session/create/schedule")
+@idempotent()
 async def create_scheduled_session(request: Request):
     return await forward_request(request, "session", "session/create/schedule")
 
 @app.post("/session/create/set-challenges")
+@idempotent()
 async def create_session_with_challenges(request: Request):
     return await forward_request(request, "session", "session/create/set-challenges")
 
 @app.post("/session/create/set-rules")
+@idempotent()
 async def create_session_with_rules(request: Request):
     return await forward_request(request, "session", "session/create/set-rules")
 
+# Session Listing Endpoints - ADDING CACHE HERE
+# Registered before /session/{id} so "existing" is not captured as a session id
+@app.get("/session/existing")
+@tracked_cache(expire=120, public=True, params=("limit", "cursor"), normalize=normalize_page_params)  # Cache for 2 minutes
+async def get_existing_sessions(request: Request):
+    return await list_sessions(request, "session/existing", sort_field="createdAt")
+
+@app.get("/session/existing/open")
+@tracked_cache(expire=60, public=True, params=())  # Cache for 1 minute
+async def get_open_sessions(request: Request):
+    return await forward_request(request, "session", "session/existing/open")
+
+@app.get("/session/existing/nearby")
+@tracked_cache(expire=60, public=True, params=("lat", "lon", "radiusKm"), defaults={"radiusKm": "10"})  # Cache for 1 minute
+async def get_nearby_sessions(request: Request):
+    return await forward_request(request, "session", "session/existing/nearby")
+
+@app.get("/session/existing/private")
+@tracked_cache(expire=300, params=("userId",))  # Cache for 5 minutes
+async def get_private_sessions(request: Request):
+    return await forward_request(request, "session", "session/existing/private")
+
+@app.get("/session/existing/completed")
+@tracked_cache(expire=600, public=True, params=("limit", "cursor"), normalize=normalize_page_params)  # Cache for 10 minutes
+async def get_completed_sessions(request: Request):
+    # Sorted by ActualEndTime, which the listing does not return, so the cursor is id-only
+    return await list_sessions(request, "session/existing/completed")
+
+@app.get("/session/existing/popular")
+@tracked_cache(expire=300, public=True, params=())  # Cache for 5 minutes
+async def get_popular_sessions(request: Request):
+    return await forward_request(request, "session", "session/existing/popular")
+
+@app.get("/session/existing/recently-updated")
+@tracked_cache(expire=60, public=True, params=("limit", "cursor"), normalize=normalize_page_params)  # Cache for 1 minute
+async def get_recently_updated_sessions(request: Request):
+    return await list_sessions(request, "session/existing/recently-updated", sort_field="lastUpdate")
+
+@app.get("/session/existing/joinable")
+@tracked_cache(expire=60, public=True, params=())  # Cache for 1 minute
+async def get_joinable_sessions(request: Request):
+    return await forward_request(request, "session", "session/existing/joinable")
+
+@app.get("/session/existing/category/{type}")
+@tracked_cache(expire=300, public=True, params=())  # Cache for 5 minutes
+async def get_sessions_by_category(request: Request, type: str):
+    return await forward_request(request, "session", f"session/existing/category/{type}")
+
+#Health Check
+# Registered before /session/{id} so "status" is not captured as a session id
+@app.get("/session/status")
+async def session_status(request: Request):
+    return await forward_request(request, "session", "session/status")
+
 # Session Details Endpoints - ADDING CACHE HERE
 @app.get("/session/{id}")
-@tracked_cache(expire=300)  # Cache for 5 minutes
+@tracked_cache(expire=300, public=True, params=())  # Cache for 5 minutes
 async def get_session(request: Request, id: str):
     return await forward_request(request, "session", f"session/{id}")
 
 @app.get("/session/{id}/details")
-@tracked_cache(expire=300)  # Cache for 5 minutes
+@tracked_cache(expire=300, public=True, params=())  # Cache for 5 minutes
 async def get_session_details(request: Request, id: str):
     return await forward_request(request, "session", f"session/{id}/details")
 
 @app.get("/session/{id}/participants")
-@tracked_cache(expire=60)  # Cache for 1 minute
+@tracked_cache(expire=60, public=True, params=())  # Cache for 1 minute
 async def get_session_participants(request: Request, id: str):
     return await forward_request(request, "session", f"session/{id}/participants")
 
 @app.get("/session/{id}/logs")
-@tracked_cache(expire=120)  # Cache for 2 minutes
+@tracked_cache(expire=120, public=True, params=())  # Cache for 2 minutes
 async def get_session_logs(request: Request, id: str):
     return await forward_request(request, "session", f"session/{id}/logs")
 
 @app.get("/session/{id}/challenges")
-@tracked_cache(expire=300)  # Cache for 5 minutes
+@tracked_cache(expire=300, public=True, params=())  # Cache for 5 minutes
 async def get_session_challenges(request: Request, id: str):
     return await forward_request(request, "session", f"session/{id}/challenges")
 
 @app.get("/session/{id}/location")
-@tracked_cache(expire=300)  # Cache for 5 minutes
+@tracked_cache(expire=300, public=True, params=())  # Cache for 5 minutes
 async def get_session_location(request: Request, id: str):
     return await forward_request(request, "session", f"session/{id}/location")
 
 @app.get("/session/{id}/owner")
-@tracked_cache(expire=600)  # Cache for 10 minutes
+@tracked_cache(expire=600, public=True, params=())  # Cache for 10 minutes
 async def get_session_owner(request: Request, id: str):
     return await forward_request(request, "session", f"session/{id}/owner")
 
 @app.get("/session/{id}/rules")
-@tracked_cache(expire=600)  # Cache for 10 minutes
+@tracked_cache(expire=600, public=True, params=())  # Cache for 10 minutes
 async def get_session_rules(request: Request, id: str):
     return await forward_request(request, "session", f"session/{id}/rules")
 
 @app.get("/session/{id}/created")
-@tracked_cache(expire=3600)  # Cache for 1 hour
+@tracked_cache(expire=3600, public=True, params=())  # Cache for 1 hour
 async def get_session_created_date(request: Request, id: str):
     return await forward_request(request, "session", f"session/{id}/created")
 
@@ -533,6 +1195,7 @@ async def activate_session(request: Request, id: str):
     return await forward_request(request, "session", f"session/{id}/activate")
 
 @app.post("/session/activate/user/{id}")
+@idempotent()
 async def activate_user_session(id: str, request: Request):
     try:
         body = await request.json()
@@ -566,57 +1229,6 @@ async def activate_session_rule(request: Request, id: str):
 async def activate_session_time(request: Request, id: str):
     return await forward_request(request, "session", f"session/activate/time/{id}")
 
-# Session Listing Endpoints - ADDING CACHE HERE
-@app.get("/session/existing")
-@tracked_cache(expire=120)  # Cache for 2 minutes
-async def get_existing_sessions(request: Request):
-    return await forward_request(request, "session", "session/existing")
-
-@app.get("/session/existing/open")
-@tracked_cache(expire=60)  # Cache for 1 minute
-async def get_open_sessions(request: Request):
-    return await forward_request(request, "session", "session/existing/open")
-
-@app.get("/session/existing/nearby")
-@tracked_cache(expire=60)  # Cache for 1 minute
-async def get_nearby_sessions(request: Request):
-    return await forward_request(request, "session", "session/existing/nearby")
-
-@app.get("/session/existing/private")
-@tracked_cache(expire=300)  # Cache for 5 minutes
-async def get_private_sessions(request: Request):
-    return await forward_request(request, "session", "session/existing/private")
-
-@app.get("/session/existing/completed")
-@tracked_cache(expire=600)  # Cache for 10 minutes
-async def get_completed_sessions(request: Request):
-    return await forward_request(request, "session", "session/existing/completed")
-
-@app.get("/session/existing/popular")
-@tracked_cache(expire=300)  # Cache for 5 minutes
-async def get_popular_sessions(request: Request):
-    return await forward_request(request, "session", "session/existing/popular")
-
-@app.get("/session/existing/recently-updated")
-@tracked_cache(expire=60)  # Cache for 1 minute
-async def get_recently_updated_sessions(request: Request):
-    return await forward_request(request, "session", "session/existing/recently-updated")
-
-@app.get("/session/existing/joinable")
-@tracked_cache(expire=60)  # Cache for 1 minute
-async def get_joinable_sessions(request: Request):
-    return await forward_request(request, "session", "session/existing/joinable")
-
-@app.get("/session/existing/category/{type}")
-@tracked_cache(expire=300)  # Cache for 5 minutes
-async def get_sessions_by_category(request: Request, type: str):
-    return await forward_request(request, "session", f"session/existing/category/{type}")
-
-#Health Check
-@app.get("/session/status")
-async def session_status(request: Request):
-    return await forward_request(request, "session", "session/status")
-
 @app.get("/health")
 async def health_check():
     """
@@ -683,6 +1295,44 @@ async def clear_cache():
     await FastAPICache.clear()
     return {"message": "Cache cleared successfully"}
 
+@app.get("/cache/stats")
+async def cache_stats(top: int = 10):
+    """
+    Per-route cache analytics: hit ratio, byte footprint, top keys, change rate and TTL
+    """
+    footprint = CACHE_FOOTPRINT
+    routes = {}
+    for route, stats in CACHE_ROUTE_STATS.items():
+        lookups = stats["hits"] + stats["misses"]
+        routes[route] = {
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "hit_ratio": round(stats["hits"] / lookups, 4) if lookups else None,
+            "entries": footprint.get(route, {}).get("entries", 0),
+            "bytes": footprint.get(route, {}).get("bytes", 0),
+            "refreshes": stats["refreshes"],
+            "changes": stats["changes"],
+            "change_rate": round(stats["changes"] / stats["refreshes"], 4) if stats["refreshes"] else None,
+            "configured_ttl": stats["configured_ttl"],
+            "min_ttl": stats["min_ttl"],
+            "max_ttl": stats["max_ttl"],
+            "ttl": int(stats["ttl"]),
+            "public": stats["public"],
+            "top_keys": [
+                {"key": key, "hits": hits} for key, hits in stats["key_hits"].most_common(top)
+            ] if stats["public"] else None
+        }
+
+    return {
+        "adaptive_ttl": {
+            "enabled": CACHE_ADAPTIVE_TTL,
+            "min": CACHE_ADAPTIVE_TTL_MIN,
+            "max": CACHE_ADAPTIVE_TTL_MAX,
+            "range": CACHE_ADAPTIVE_TTL_RANGE
+        },
+        "routes": routes
+    }
+
 @app.post("/cache/clear/{key}")
 async def clear_cache_key(key: str):
     """